@@ -2,12 +2,30 @@ import os
 import shutil
 import tempfile
 import logging
+import logging.handlers
 import base64
+import codecs
+import csv
+import hashlib
+import heapq
+import io
+import json
+import random
+import re
+import subprocess
+import threading
+import time
+from collections import Counter, OrderedDict
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from urllib.parse import urlparse, urlunparse, quote
 from azure.devops.connection import Connection
 from msrest.authentication import BasicAuthentication
 from azure.devops.v7_0.git.models import GitRepository
 from pygount import ProjectSummary, SourceAnalysis
+from pygount.analysis import SourceState, encoding_for, has_lexer
 from tabulate import tabulate
 from git import Repo
 from dotenv import load_dotenv
@@ -37,6 +55,26 @@ OUTPUT_FILE = os.getenv('OUTPUT_FILE', 'code_analysis_report.md')
 CSV_OUTPUT_FILE = os.getenv('CSV_OUTPUT_FILE', 'code_analysis_report.csv')
 LOG_FILE = os.getenv('LOG_FILE', '/tmp/azuredevops_scan.log')
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+ANALYSIS_CACHE_ENABLED = os.getenv('ANALYSIS_CACHE_ENABLED', 'true').lower() == 'true'
+ANALYSIS_CACHE_FILE = os.getenv('ANALYSIS_CACHE_FILE', OUTPUT_FILE + '.cache.json')
+CLONE_JOBS = int(os.getenv('CLONE_JOBS', '8'))  # Repositories cloned and analyzed in parallel
+ANALYZE_JOBS = int(os.getenv('ANALYZE_JOBS', str(os.cpu_count() or 1)))  # Worker processes counting lines
+SCAN_TMPFS = os.getenv('SCAN_TMPFS', '/dev/shm' if os.path.isdir('/dev/shm') else '')  # RAM-backed directory for clones
+SCAN_TMPFS_MIN_FREE_MB = int(os.getenv('SCAN_TMPFS_MIN_FREE_MB', '4096'))
+CLONE_CACHE_ENABLED = os.getenv('CLONE_CACHE_ENABLED', 'false').lower() == 'true'
+CLONE_CACHE_DIR = os.path.expanduser(os.getenv('CLONE_CACHE_DIR', '~/.cache/azuredevops-scan'))
+ANALYZER = os.getenv('ANALYZER', 'pygount').lower()  # 'pygount', 'tokei' or 'scc'
+ANALYZER_PATH = shutil.which(ANALYZER) if ANALYZER in ('tokei', 'scc') else None
+MAX_FILE_SIZE_MB = float(os.getenv('MAX_FILE_SIZE_MB', '5'))  # Larger files are not counted, 0 disables the limit
+
+# Azure DevOps authentication: Base64 encode ':PAT'. Git gets the header through the environment,
+# so the token is neither visible in the process list nor written to a repository config.
+# Protocol v2 lets the server send only the refs that are asked for, and a rejected token
+# fails the command instead of waiting for a password prompt.
+AUTH_HEADER = 'Authorization: Basic ' + base64.b64encode(f':{PERSONAL_ACCESS_TOKEN}'.encode('utf-8')).decode('utf-8')
+GIT_ENV = dict(os.environ, GIT_TERMINAL_PROMPT='0', GIT_CONFIG_COUNT='2',
+               GIT_CONFIG_KEY_0='http.extraHeader', GIT_CONFIG_VALUE_0=AUTH_HEADER,
+               GIT_CONFIG_KEY_1='protocol.version', GIT_CONFIG_VALUE_1='2')
 
 # LLM Configuration
 LLM_ENABLED = os.getenv('LLM_ENABLED', 'false').lower() == 'true'
@@ -47,88 +85,174 @@ LLM_PROMPT = os.getenv('LLM_PROMPT', 'Analyze this repository.')
 LLM_OUTPUT_DIR = os.getenv('LLM_OUTPUT_DIR', './repository_descriptions')
 LLM_MAX_FILES = int(os.getenv('LLM_MAX_FILES', '50'))
 LLM_MAX_TOKENS = int(os.getenv('LLM_MAX_TOKENS', '100000'))
+LLM_CACHE_DIR = os.path.expanduser(os.getenv('LLM_CACHE_DIR', os.path.join(LLM_OUTPUT_DIR, '.cache')))
+LLM_JOBS = int(os.getenv('LLM_JOBS', '2'))
+LLM_TOKENS_PER_MINUTE = int(os.getenv('LLM_TOKENS_PER_MINUTE', '250000'))
+
+# directory names to ignore to speed up processing
+IGNORE_PATTERNS = frozenset([".git", "node_modules", "bin", "obj", ".vs"])
+
+# files collected first for LLM analysis, matched anywhere in the lowercased file name
+PRIORITY_FILE_PATTERNS = [
+    'readme', 'readme.md', 'readme.txt',
+    'package.json', 'requirements.txt', '.csproj', 'pom.xml', 'build.gradle',
+    'app.json', 'manifest.json', 'appsettings.json',
+    'main.', 'index.', 'app.', 'program.cs', 'startup.cs',
+    'dockerfile', 'docker-compose', '.gitignore',
+    'changelog', 'license', 'contributing'
+]
+PRIORITY_FILE_RE = re.compile('|'.join(re.escape(pattern) for pattern in PRIORITY_FILE_PATTERNS))
+PRIORITY_DOC_EXTENSIONS = ('.md', '.json', '.txt', '.yml', '.yaml')
+PRIORITY_CODE_EXTENSIONS = ('.cs', '.py', '.js', '.ts', '.al')
+
+# byte order marks of text files that may contain NUL bytes, as pygount checks them
+TEXT_BOMS = (codecs.BOM_UTF16_BE, codecs.BOM_UTF16_LE, codecs.BOM_UTF32_BE, codecs.BOM_UTF32_LE, codecs.BOM_UTF8)
+
+# pygount pseudo-languages for files that are not counted
+PSEUDO_LANGUAGES = frozenset(['__binary__', '__error__', '__unknown__', '__empty__', '__generated__'])
+
+# bumped whenever counting rules change, so results cached by older versions are not reused
+CACHE_VERSION = 1
+
+# LLM errors without a status code that still mean "slow down"
+RATE_LIMIT_STATUS_RE = re.compile(r'\b429\b')
+RATE_LIMIT_MESSAGE_RE = re.compile(r'quota|rate', re.IGNORECASE)
 
-# extensions to ignore to speed up processing
-IGNORE_PATTERNS = [".git", "node_modules", "bin", "obj", ".vs"] 
+# number of pygount results remembered per process for files seen again
+SOURCE_ANALYSES_CACHED = 50000
+
+# characters reserved for the status block at the top of the markdown report
+REPORT_STATUS_WIDTH = 128
+
+# number of finished repositories between flushes of the reports
+REPORT_FLUSH_EVERY = 16
+
+# binary artifacts left out of the checkout, they are never counted as code
+SPARSE_CHECKOUT_EXCLUDE = [
+    ".zip", ".tar", ".gz", ".7z", ".png", ".jpg", ".jpeg", ".gif", ".ico", ".pdf",
+    ".dll", ".exe", ".so", ".dylib", ".pdb", ".nupkg", ".mp4", ".mov"
+]
+
+# file extensions that are never source code, skipped without being opened
+BINARY_EXTENSIONS = frozenset(SPARSE_CHECKOUT_EXCLUDE + [
+    ".rar", ".bz2", ".xz", ".jar", ".war", ".class", ".pyc", ".o", ".a", ".lib", ".app",
+    ".bmp", ".tif", ".tiff", ".webp", ".woff", ".woff2", ".ttf", ".otf", ".eot",
+    ".mp3", ".wav", ".avi", ".psd", ".ai", ".docx", ".xlsx", ".pptx", ".parquet", ".bin", ".db", ".sqlite"
+])
+
+# minified bundles are generated, not written by hand
+MINIFIED_SUFFIXES = (".min.js", ".min.css")
+
+# matches one whole line of AL source bytes, capturing '//', '/*', the first non-blank byte or nothing
+AL_LINE_PREFIX_RE = re.compile(rb'[ \t\x0b\x0c\x1c-\x1f]*(/[/*]|\S?)[^\n]*\n')
+# the same for non-ASCII source, where the UTF-8 encoded Unicode spaces are blank too, as for str.strip()
+AL_LINE_PREFIX_UNICODE_RE = re.compile(
+    rb'[ \t\x0b\x0c\x1c-\x1f]*'
+    rb'(?:(?:\xc2[\x85\xa0]|\xe1\x9a\x80|\xe2\x80[\x80-\x8a\xa8\xa9\xaf]|\xe2\x81\x9f|\xe3\x80\x80)[ \t\x0b\x0c\x1c-\x1f]*)*'
+    rb'(/[/*]|\S?)[^\n]*\n'
+)
 
-# Setup Logging
 logger = logging.getLogger(__name__)
-logger.setLevel(getattr(logging, LOG_LEVEL))
 
-# Create formatter
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+# Set once a worker of the shared analysis pool died, later repositories are counted in-process
+analysis_pool_broken = threading.Event()
 
-# Console handler
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-console_handler.setFormatter(formatter)
+# pygount results by file name and content hash, least recently used first. Each worker process has its own.
+source_analyses = OrderedDict()
+source_analyses_lock = threading.Lock()
 
-# File handler - use 'w' mode to clear the file on each run
-file_handler = logging.FileHandler(LOG_FILE, mode='w')
-file_handler.setLevel(getattr(logging, LOG_LEVEL))
-file_handler.setFormatter(formatter)
+# LLM requests in flight, and the Gemini tokens left in the current minute
+llm_slots = threading.Semaphore(LLM_JOBS)
+llm_pacing_lock = threading.Lock()
+llm_tokens = LLM_TOKENS_PER_MINUTE
+llm_tokens_updated = time.monotonic()
 
-# Add handlers to logger
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
+def setup_logging():
+    """Attach console and file handlers. Called from main() only, so worker processes never truncate the log."""
+    logger.setLevel(getattr(logging, LOG_LEVEL))
+    
+    # Create formatter
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    
+    # Console handler
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(formatter)
+    
+    # File handler - use 'w' mode to clear the file on each run
+    file_handler = logging.FileHandler(LOG_FILE, mode='w')
+    file_handler.setLevel(getattr(logging, LOG_LEVEL))
+    file_handler.setFormatter(formatter)
+    
+    # Add handlers to logger
+    logger.addHandler(console_handler)
+    logger.addHandler(file_handler)
+    
+    logger.info(f"Logging initialized. Log file: {LOG_FILE}")
 
-logger.info(f"Logging initialized. Log file: {LOG_FILE}")
+def setup_worker_logging(log_queue):
+    """Send the log records of an analysis worker process to main() through log_queue."""
+    logger.setLevel(getattr(logging, LOG_LEVEL))
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+def scan_files(directory):
+    """Yield a DirEntry for every regular file below directory, skipping ignored directories and symlinks.
+    
+    os.scandir reports the entry type from the directory listing itself, so no extra stat() call is needed per entry.
+    """
+    stack = [directory]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError as e:
+            logger.debug(f"Error reading directory: {e}")
+            continue
+        
+        with entries:
+            for entry in entries:
+                # Symlinks are not followed, they could loop or point outside the checkout
+                if entry.is_dir(follow_symlinks=False):
+                    # Skip ignored directories
+                    if entry.name.lower() not in IGNORE_PATTERNS:
+                        stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
 
 def collect_repository_context(repo_dir, max_files=50, max_tokens=100000):
     """Collect important files from repository for LLM analysis."""
     important_files = []
     
-    # Priority file patterns
-    priority_patterns = [
-        'readme', 'readme.md', 'readme.txt',
-        'package.json', 'requirements.txt', '*.csproj', 'pom.xml', 'build.gradle',
-        'app.json', 'manifest.json', 'appsettings.json',
-        'main.', 'index.', 'app.', 'program.cs', 'startup.cs',
-        'dockerfile', 'docker-compose', '.gitignore',
-        'changelog', 'license', 'contributing'
-    ]
-    
     # Collect files with priority scoring
     files_with_score = []
     
-    for root, dirs, files in os.walk(repo_dir):
-        # Skip ignored directories
-        dirs[:] = [d for d in dirs if not any(pattern in d.lower() for pattern in IGNORE_PATTERNS)]
+    for entry in scan_files(repo_dir):
+        file_path = entry.path
+        file = entry.name
+        file_lower = file.lower()
         
-        for file in files:
-            file_path = os.path.join(root, file)
-            file_lower = file.lower()
-            
-            # Skip ignored patterns
-            if any(pattern in file_path for pattern in IGNORE_PATTERNS):
-                continue
-            
-            # Calculate priority score
-            score = 0
-            for pattern in priority_patterns:
-                if pattern in file_lower:
-                    score += 10
-                    break
-            
-            # Boost score for certain extensions
-            if any(file_lower.endswith(ext) for ext in ['.md', '.json', '.txt', '.yml', '.yaml']):
-                score += 5
-            if any(file_lower.endswith(ext) for ext in ['.cs', '.py', '.js', '.ts', '.al']):
-                score += 3
-            
-            # Penalize large files
-            try:
-                size = os.path.getsize(file_path)
-                if size > 100000:  # >100KB
-                    score -= 5
-            except:
-                pass
-            
-            files_with_score.append((file_path, score, file))
+        # Calculate priority score
+        score = 0
+        if PRIORITY_FILE_RE.search(file_lower):
+            score += 10
+        
+        # Boost score for certain extensions
+        if file_lower.endswith(PRIORITY_DOC_EXTENSIONS):
+            score += 5
+        if file_lower.endswith(PRIORITY_CODE_EXTENSIONS):
+            score += 3
+        
+        # Penalize large files
+        try:
+            size = entry.stat().st_size
+            if size > 100000:  # >100KB
+                score -= 5
+        except:
+            pass
+        
+        files_with_score.append((file_path, score, file))
     
-    # Sort by score and take top files
-    files_with_score.sort(key=lambda x: x[1], reverse=True)
-    selected_files = files_with_score[:max_files]
+    # Take the top files by score, in walk order among equal scores
+    selected_files = heapq.nlargest(max_files, files_with_score, key=lambda x: x[1])
     
     # Build context string
     context_parts = []
@@ -160,32 +284,74 @@ def collect_repository_context(repo_dir, max_files=50, max_tokens=100000):
     
     return ''.join(context_parts)
 
-def get_directory_tree(directory, max_depth=3, current_depth=0, prefix=""):
-    """Generate a simple directory tree string."""
-    if current_depth >= max_depth:
-        return ""
-    
-    tree = []
+def list_tree_level(directory):
+    """List the first 20 entries of a directory by name for the tree, or none if it cannot be read."""
     try:
-        items = sorted(os.listdir(directory))
-        for item in items[:20]:  # Limit items per level
-            if any(pattern in item for pattern in IGNORE_PATTERNS):
-                continue
-            
-            item_path = os.path.join(directory, item)
-            if os.path.isdir(item_path):
-                tree.append(f"{prefix}├── {item}/")
-                if current_depth < max_depth - 1:
-                    subtree = get_directory_tree(item_path, max_depth, current_depth + 1, prefix + "│   ")
-                    if subtree:
-                        tree.append(subtree)
-            else:
-                tree.append(f"{prefix}├── {item}")
-    except Exception as e:
+        with os.scandir(directory) as entries:
+            return sorted(entries, key=lambda entry: entry.name)[:20]  # Limit items per level
+    except OSError as e:
         logger.debug(f"Error reading directory {directory}: {e}")
+        return []
+
+def get_directory_tree(directory, max_depth=3):
+    """Generate a simple directory tree string."""
+    tree = []
+    # One iterator per open level, so each directory is followed by its subtree as in a recursive walk
+    stack = [(iter(list_tree_level(directory)), 0, "")] if max_depth > 0 else []
+    while stack:
+        entries, depth, prefix = stack[-1]
+        entry = next(entries, None)
+        if entry is None:
+            stack.pop()
+            continue
+        if entry.name.lower() in IGNORE_PATTERNS:
+            continue
+        
+        if entry.is_dir(follow_symlinks=False):
+            tree.append(f"{prefix}├── {entry.name}/")
+            if depth < max_depth - 1:
+                stack.append((iter(list_tree_level(entry.path)), depth + 1, prefix + "│   "))
+        else:
+            tree.append(f"{prefix}├── {entry.name}")
     
     return "\n".join(tree)
 
+def wait_for_llm_tokens(tokens):
+    """Block until the Gemini quota of LLM_TOKENS_PER_MINUTE has room for a request of tokens, across all workers."""
+    global llm_tokens, llm_tokens_updated
+    # A request larger than the whole quota waits for a full bucket rather than forever
+    tokens = min(tokens, LLM_TOKENS_PER_MINUTE)
+    with llm_pacing_lock:
+        # Refill for the time since the last request, then reserve; a negative balance is paid back by waiting
+        now = time.monotonic()
+        llm_tokens = min(LLM_TOKENS_PER_MINUTE, llm_tokens + (now - llm_tokens_updated) * LLM_TOKENS_PER_MINUTE / 60)
+        llm_tokens_updated = now
+        llm_tokens -= tokens
+        wait = max(0.0, -llm_tokens * 60 / LLM_TOKENS_PER_MINUTE)
+    time.sleep(wait)
+
+def call_llm_with_retries(request, max_attempts=5):
+    """Call request(), retrying rate limits and server overloads with exponential backoff and jitter."""
+    for attempt in range(max_attempts):
+        try:
+            return request()
+        except Exception as e:
+            # Anthropic errors carry status_code, Google API errors carry code
+            status = getattr(e, 'status_code', None) or getattr(e, 'code', None)
+            # Otherwise only a 429 reported as a quota or rate limit in the message counts
+            rate_limited = status in (429, 500, 502, 503, 529) or (
+                RATE_LIMIT_STATUS_RE.search(str(e)) and RATE_LIMIT_MESSAGE_RE.search(str(e)))
+            if attempt == max_attempts - 1 or not rate_limited:
+                raise
+            # Wait as long as the server asks if it says so, otherwise a random share of a doubling delay
+            retry_match = re.search(r'retry in ([\d.]+)s', str(e))
+            if retry_match:
+                wait_time = float(retry_match.group(1)) + random.uniform(1, 3)
+            else:
+                wait_time = random.uniform(0, min(60, 4 * 2 ** attempt))
+            logger.info(f"  Rate limit hit, waiting {wait_time:.0f} seconds...")
+            time.sleep(wait_time)
+
 def analyze_repository_with_llm(repo_dir, repo_name, project_name):
     """Analyze repository using LLM (Gemini or Claude) and generate description."""
     if not LLM_ENABLED or not LLM_API_KEY:
@@ -199,88 +365,90 @@ def analyze_repository_with_llm(repo_dir, repo_name, project_name):
         
         description = None
         
-        if LLM_PROVIDER == 'anthropic':
-            # Use Claude
-            client = Anthropic(api_key=LLM_API_KEY)
-            message = client.messages.create(
-                model=LLM_MODEL,
-                max_tokens=2000,
-                messages=[{
-                    "role": "user",
-                    "content": f"{LLM_PROMPT}\n\nRepository: {project_name}/{repo_name}\n\n{context}"
-                }]
-            )
-            description = message.content[0].text
-            
-        elif LLM_PROVIDER == 'gemini':
-            # Use Gemini with retry logic for rate limits
-            import time
-            genai.configure(api_key=LLM_API_KEY)
-            model = genai.GenerativeModel(LLM_MODEL)
-            
-            prompt = f"{LLM_PROMPT}\n\nRepository: {project_name}/{repo_name}\n\n{context}"
-            
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    response = model.generate_content(prompt)
-                    description = response.text
-                    break
-                except Exception as e:
-                    if '429' in str(e) and 'Quota exceeded' in str(e):
-                        if attempt < max_retries - 1:
-                            # Extract retry delay from error message if available
-                            import re
-                            retry_match = re.search(r'retry in ([\d.]+)s', str(e))
-                            if retry_match:
-                                wait_time = float(retry_match.group(1)) + 2  # Add 2 seconds buffer
-                            else:
-                                wait_time = 60  # Default wait time
-                            logger.info(f"  Rate limit hit, waiting {wait_time:.0f} seconds...")
-                            time.sleep(wait_time)
-                        else:
-                            raise
-                    else:
-                        raise
+        # Unchanged context gives the same answer, reuse the description of an earlier run
+        cache_file = None
+        if ANALYSIS_CACHE_ENABLED:
+            key = hashlib.blake2b(f"{LLM_PROVIDER}\0{LLM_MODEL}\0{LLM_PROMPT}\0{project_name}/{repo_name}\0{context}".encode('utf-8'), digest_size=16).hexdigest()
+            cache_file = os.path.join(LLM_CACHE_DIR, f"{key}.md")
+            try:
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    description = f.read()
+                logger.info("  Repository context unchanged, reusing the cached description")
+            except FileNotFoundError:
+                pass
         
-        else:
-            logger.error(f"  Unknown LLM provider: {LLM_PROVIDER}")
-            return False
+        if description is None:
+            # Only LLM_JOBS requests are in flight at a time, whatever the number of clone workers
+            with llm_slots:
+                if LLM_PROVIDER == 'anthropic':
+                    # Use Claude
+                    # The SDK retries on its own by default, leave that to call_llm_with_retries
+                    client = Anthropic(api_key=LLM_API_KEY, max_retries=0)
+                    message = call_llm_with_retries(lambda: client.messages.create(
+                        model=LLM_MODEL,
+                        max_tokens=2000,
+                        messages=[{
+                            "role": "user",
+                            "content": f"{LLM_PROMPT}\n\nRepository: {project_name}/{repo_name}\n\n{context}"
+                        }]
+                    ))
+                    description = message.content[0].text
+                    
+                elif LLM_PROVIDER == 'gemini':
+                    # Use Gemini with retry logic for rate limits
+                    genai.configure(api_key=LLM_API_KEY)
+                    model = genai.GenerativeModel(LLM_MODEL)
+                    
+                    prompt = f"{LLM_PROMPT}\n\nRepository: {project_name}/{repo_name}\n\n{context}"
+                    # Same rough estimate as the context limit (1 token ≈ 3 chars), plus the response
+                    wait_for_llm_tokens(len(prompt) // 3 + 2000)
+                    
+                    response = call_llm_with_retries(lambda: model.generate_content(prompt))
+                    description = response.text
+                
+                else:
+                    logger.error(f"  Unknown LLM provider: {LLM_PROVIDER}")
+                    return False
         
         if not description:
             logger.warning(f"  Empty response from LLM for {repo_name}")
             return False
         
+        if cache_file and not os.path.exists(cache_file):
+            os.makedirs(LLM_CACHE_DIR, exist_ok=True)
+            temp_file = f"{cache_file}.{threading.get_ident()}.tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                f.write(description)
+            os.replace(temp_file, cache_file)
+        
         # Ensure output directory exists
         os.makedirs(LLM_OUTPUT_DIR, exist_ok=True)
         
         # Save to file
         output_file = os.path.join(LLM_OUTPUT_DIR, f"README-{project_name}-{repo_name}.md")
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(f"# {project_name} / {repo_name}\n\n")
-            f.write(f"*AI-Generated Repository Analysis*\n\n")
-            f.write(f"---\n\n")
-            f.write(description)
-            f.write(f"\n\n---\n\n")
-            f.write(f"*Generated on: {os.popen('date').read().strip()}*\n")
-            f.write(f"*Model: {LLM_MODEL} ({LLM_PROVIDER})*\n")
+        document = (
+            f"# {project_name} / {repo_name}\n\n"
+            f"*AI-Generated Repository Analysis*\n\n"
+            f"---\n\n"
+            f"{description}"
+            f"\n\n---\n\n"
+            f"*Generated on: {datetime.now().astimezone():%a %b %d %H:%M:%S %Z %Y}*\n"
+            f"*Model: {LLM_MODEL} ({LLM_PROVIDER})*\n"
+        )
+        # Encoded once and written in a single call, bypassing the text layer
+        with open(output_file, 'wb') as f:
+            f.write(document.encode('utf-8'))
         
         logger.info(f"  ✓ AI description saved to {output_file}")
         
-        # Add delay between requests for Gemini free tier (250K tokens/minute limit)
-        if LLM_PROVIDER == 'gemini':
-            import time
-            time.sleep(15)  # Wait 15 seconds between requests to stay under rate limit
-        
         return True
         
     except Exception as e:
         logger.warning(f"  LLM analysis failed for {repo_name}: {e}")
         return False
 
-def get_all_repositories(connection):
+def get_all_repositories(connection, git_client):
     """Retrieves all repositories across all projects in the Org."""
-    git_client = connection.clients.get_git_client()
     core_client = connection.clients.get_core_client()
     
     all_repos = []
@@ -288,173 +456,316 @@ def get_all_repositories(connection):
     
     logger.info(f"Found {len(projects)} projects. Scanning for repositories...")
     
-    for project in projects:
-        repos = git_client.get_repositories(project.id)
-        for repo in repos:
-            all_repos.append((project.name, repo))
+    # One REST round trip per project, listed concurrently
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        repos_per_project = executor.map(lambda project: (project.name, git_client.get_repositories(project.id)), projects)
+        for project_name, repos in repos_per_project:
+            for repo in repos:
+                all_repos.append((project_name, repo))
             
     return all_repos
 
-def analyze_directory(directory):
-    """Uses Pygount to count lines in a directory."""
+def count_al_lines(data):
+    """Count code, comment and empty lines in Business Central AL source bytes. Returns (code, comments, empty)."""
+    # Same line endings as reading the file in text mode
+    if b'\r' in data:
+        data = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+    if data and not data.endswith(b'\n'):
+        data += b'\n'
+    
+    # The regex engine classifies every line by its first non-blank bytes in one
+    # pass, and Counter tallies the results in C instead of a Python loop per line
+    line_re = AL_LINE_PREFIX_RE if data.isascii() else AL_LINE_PREFIX_UNICODE_RE
+    prefixes = line_re.findall(data)
+    counts = Counter(prefixes)
+    empty_lines = counts[b'']
+    comment_lines = counts[b'//'] + counts[b'/*']
+    
+    # Lines inside a block comment are comments too, unless they are blank. Only lines
+    # starting with '/*' open a block, and it ends on the first line containing '*/'.
+    # Both are found with searches over the whole file, the lines in between are tallied
+    # with list slices, so there is no Python loop per line.
+    if counts[b'/*']:
+        # Numbers of the lines containing '*/'
+        closing_lines = []
+        line = start = 0
+        pos = data.find(b'*/')
+        while pos >= 0:
+            line += data.count(b'\n', start, pos)
+            closing_lines.append(line)
+            # Continue on the next line
+            start = data.index(b'\n', pos) + 1
+            line += 1
+            pos = data.find(b'*/', start)
+        # A block that is never closed runs to the end of the file
+        closing_lines.append(len(prefixes) - 1)
+        
+        i = k = 0
+        while True:
+            try:
+                i = prefixes.index(b'/*', i)
+            except ValueError:
+                break
+            while closing_lines[k] < i:
+                k += 1
+            end = closing_lines[k]
+            if end > i:
+                block = prefixes[i + 1:end + 1]
+                comment_lines += len(block) - block.count(b'') - block.count(b'//') - block.count(b'/*')
+            i = end + 1
+    
+    code_lines = len(prefixes) - empty_lines - comment_lines
+    return code_lines, comment_lines, empty_lines
+
+def analyze_source(file_path, content):
+    """Run pygount on the bytes of a file that was already read, instead of letting it open the file again.
+    
+    The caller checks has_lexer(file_path) first, it is costly enough to run only once per file.
+    Returns the SourceAnalysis, or None for empty and binary files.
+    """
+    # The checks pygount makes on the file itself before analyzing it
+    head = content[:8192]
+    if not content or (b'\0' in head and not head.startswith(TEXT_BOMS)):
+        return None
+    
+    # Vendored and boilerplate files recur across repositories, pygount only depends on their name and content
+    key = (os.path.basename(file_path), hashlib.blake2b(content, digest_size=16).digest())
+    with source_analyses_lock:
+        if key in source_analyses:
+            source_analyses.move_to_end(key)
+            return source_analyses[key]
+    
+    encoding = encoding_for(file_path, 'automatic', 'utf-8', file_handle=io.BytesIO(content))
+    # A text handle decodes and normalizes line endings like pygount opening the file does
+    analysis = SourceAnalysis.from_file(file_path, "pygount", encoding=encoding,
+                                        file_handle=io.TextIOWrapper(io.BytesIO(content), encoding=encoding))
+    with source_analyses_lock:
+        source_analyses[key] = analysis
+        if len(source_analyses) > SOURCE_ANALYSES_CACHED:
+            source_analyses.popitem(last=False)
+    return analysis
+
+def analyze_file(file_path):
+    """Count the lines of a single file. Returns (language, code, documentation, empty, string), or None if it is not counted.
+    
+    Runs in worker processes, so it only takes and returns plain picklable values.
+    """
+    try:
+        file_size = os.path.getsize(file_path)
+    except OSError as e:
+        logger.debug(f"Skipping {file_path}: {e}")
+        return None
+    
+    # Skip oversized files, they are generated or data rather than hand-written code
+    if MAX_FILE_SIZE_MB > 0 and file_size > MAX_FILE_SIZE_MB * 1024 * 1024:
+        logger.debug(f"Skipping oversized file: {file_path}")
+        return None
+    
+    # File type and the JSON heuristics only look at the lowercased name
+    filename_lower = os.path.basename(file_path).lower()
+    
+    # Check if this is a JSON file - distinguish config vs data
+    if filename_lower.endswith('.json'):
+        content = None
+        try:
+            # Heuristics to determine if JSON is configuration or data:
+            # Config files are typically: small, have mixed types, contain settings/metadata keys
+            # Data files are typically: large, array-heavy, repetitive structure
+            
+            # Heuristics for data files:
+            # 1. Large file size (>100KB typically data)
+            # 2. Root is a large array (common in data exports)
+            # 3. Highly repetitive structure (many identical keys)
+            
+            # Config file indicators (override data classification if found)
+            config_indicators = ['package.json', 'tsconfig', 'jsconfig', 'settings', 
+                               'config', 'launch', 'tasks', 'manifest', 'schema',
+                               '.eslintrc', '.prettierrc', 'appsettings', 'web.config']
+            if any(indicator in filename_lower for indicator in config_indicators):
+                is_data = False
+            
+            # Large files and data-like filenames are classified without reading the file
+            elif file_size > 102400:  # 100KB
+                is_data = True
+            elif any(pattern in filename_lower for pattern in ['data', 'export', 'dump', 'records', 'rows', 'backup']):
+                is_data = True
+            
+            else:
+                # Other files are read once, the content is counted below if they are config.
+                # Only a root array has to be parsed, to count its items.
+                is_data = False
+                with open(file_path, 'rb') as f:
+                    content = f.read()
+                if content.lstrip()[:1] == b'[':
+                    try:
+                        json_obj = json.loads(content.decode('utf-8', 'ignore'))
+                        if isinstance(json_obj, list) and len(json_obj) > 20:
+                            is_data = True
+                    except json.JSONDecodeError:
+                        # If we can't parse it, treat it as config (safer to include)
+                        pass
+            
+            # If classified as data, skip counting it
+            if is_data:
+                logger.debug(f"Skipping data JSON: {file_path}")
+                return None
+        except Exception as e:
+            logger.debug(f"Error analyzing JSON file {file_path}: {e}")
+        
+        # Process as regular JSON config file
+        try:
+            if content is None:
+                with open(file_path, 'rb') as f:
+                    content = f.read()
+            analysis = analyze_source(file_path, content) if has_lexer(file_path) else None
+            if analysis is not None and analysis.language not in PSEUDO_LANGUAGES:
+                # Count it under a custom language name
+                return ('JSON (config)', analysis.code_count, analysis.documentation_count,
+                        analysis.empty_count, analysis.string_count)
+        except Exception as e:
+            logger.debug(f"Error processing JSON config {file_path}: {e}")
+        return None
+    
+    # Check if this is an AL file (Business Central)
+    if filename_lower.endswith('.al'):
+        try:
+            # Read raw bytes, AL syntax is ASCII so the lines are classified without decoding
+            with open(file_path, 'rb') as f:
+                code_lines, comment_lines, empty_lines = count_al_lines(f.read())
+            return ('AL', code_lines, comment_lines, empty_lines, 0)
+        except Exception as e:
+            logger.debug(f"Error processing AL file {file_path}: {e}")
+        return None
+    
+    try:
+        # pygount will try to infer the language, files without a lexer are not even read
+        if not has_lexer(file_path):
+            return None
+        with open(file_path, 'rb') as f:
+            analysis = analyze_source(file_path, f.read())
+        
+        # Skip pseudo-languages
+        if analysis is not None and analysis.language not in PSEUDO_LANGUAGES:
+            return (analysis.language, analysis.code_count, analysis.documentation_count,
+                    analysis.empty_count, analysis.string_count)
+    except Exception as e:
+        # Suppress warnings for unknown languages
+        if "unknown language" not in str(e).lower():
+            logger.debug(f"Skipping {file_path}: {e}")
+    return None
+
+def empty_stats():
+    """Statistics of a repository without any counted lines."""
+    return {"code": 0, "documentation": 0, "empty": 0, "languages": "", "language_breakdown": []}
+
+def run_native_analyzer(directory):
+    """Count lines in a directory with tokei or scc, leaving out AL and JSON files. Returns [(language, code, comments, blanks)], or None if it failed."""
+    # AL and JSON files keep their own analyzers
+    if ANALYZER == 'scc':
+        command = [ANALYZER_PATH, '--format', 'json', '--no-ignore', '--no-gitignore',
+                   '--exclude-dir', ','.join(sorted(IGNORE_PATTERNS)), '--exclude-ext', 'al,json',
+                   '--not-match', r'\.min\.(js|css)$', directory]
+    else:
+        command = [ANALYZER_PATH, '--output', 'json', '--hidden', '--no-ignore']
+        for pattern in sorted(IGNORE_PATTERNS) + ['*.al', '*.AL', '*.json', '*.JSON'] + [f'*{suffix}' for suffix in MINIFIED_SUFFIXES]:
+            command += ['--exclude', pattern]
+        command.append(directory)
+    
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+    if result.returncode != 0:
+        logger.warning(f"{ANALYZER} failed on {directory}, using pygount instead: {result.stderr[-4096:].decode('utf-8', 'replace')}")
+        return None
+    
+    languages = []
+    if ANALYZER == 'scc':
+        for stats in json.loads(result.stdout) or []:
+            if stats['Code'] or stats['Comment'] or stats['Blank']:
+                languages.append((stats['Name'], stats['Code'], stats['Comment'], stats['Blank']))
+        return languages
+    
+    for language, stats in json.loads(result.stdout).items():
+        if language == 'Total':
+            continue
+        code, comments, blanks = stats['code'], stats['comments'], stats['blanks']
+        # Code embedded in other files, such as Markdown code blocks, counts for the host language
+        for reports in stats.get('children', {}).values():
+            for report in reports:
+                code += report['stats']['code']
+                comments += report['stats']['comments']
+                blanks += report['stats']['blanks']
+        if code or comments or blanks:
+            languages.append((language, code, comments, blanks))
+    return languages
+
+def analyze_directory(directory, analysis_pool=None):
+    """Uses Pygount (or tokei/scc when configured) to count lines in a directory, spreading files over analysis_pool when given.
+    
+    Raises an exception if the directory could not be analyzed.
+    """
     try:
         # pygount searches files and counts based on extensions
         summary = ProjectSummary()
         
-        # Walk through directory manually
-        import os
-        import json
-        for root, dirs, files in os.walk(directory):
-            # Skip ignored directories
-            dirs[:] = [d for d in dirs if not any(pattern in d for pattern in IGNORE_PATTERNS)]
-            
-            for file in files:
-                file_path = os.path.join(root, file)
-                # Skip files in ignored patterns
-                if any(pattern in file_path for pattern in IGNORE_PATTERNS):
-                    continue
-                
-                # Check if this is a JSON file - distinguish config vs data
-                if file_path.lower().endswith('.json'):
-                    try:
-                        # Heuristics to determine if JSON is configuration or data:
-                        # Config files are typically: small, have mixed types, contain settings/metadata keys
-                        # Data files are typically: large, array-heavy, repetitive structure
-                        
-                        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                            content = f.read()
-                            
-                        # Check file size (data files are usually larger)
-                        file_size = len(content)
-                        
-                        # Try to parse JSON
-                        try:
-                            json_obj = json.loads(content)
-                            
-                            # Heuristics for data files:
-                            # 1. Root is a large array (common in data exports)
-                            # 2. Large file size (>100KB typically data)
-                            # 3. Highly repetitive structure (many identical keys)
-                            
-                            is_data = False
-                            
-                            # Check if root is a large array
-                            if isinstance(json_obj, list) and len(json_obj) > 20:
-                                is_data = True
-                            
-                            # Check file size
-                            elif file_size > 102400:  # 100KB
-                                is_data = True
-                            
-                            # Check for data-like filenames
-                            filename_lower = os.path.basename(file_path).lower()
-                            if any(pattern in filename_lower for pattern in ['data', 'export', 'dump', 'records', 'rows', 'backup']):
-                                is_data = True
-                            
-                            # Config file indicators (override data classification if found)
-                            config_indicators = ['package.json', 'tsconfig', 'jsconfig', 'settings', 
-                                               'config', 'launch', 'tasks', 'manifest', 'schema',
-                                               '.eslintrc', '.prettierrc', 'appsettings', 'web.config']
-                            if any(indicator in filename_lower for indicator in config_indicators):
-                                is_data = False
-                            
-                            # If classified as data, skip counting it
-                            if is_data:
-                                logger.debug(f"Skipping data JSON: {file_path}")
-                                continue
-                                
-                        except json.JSONDecodeError:
-                            # If we can't parse it, treat it as config (safer to include)
-                            pass
-                    except Exception as e:
-                        logger.debug(f"Error analyzing JSON file {file_path}: {e}")
-                    
-                    # Process as regular JSON config file
-                    try:
-                        analysis = SourceAnalysis.from_file(file_path, "pygount", fallback_encoding="utf-8")
-                        if analysis.language not in ['__binary__', '__error__', '__unknown__', '__empty__', '__generated__']:
-                            # Create a custom analysis with renamed language
-                            from pygount.analysis import SourceAnalysis as SA, SourceState
-                            config_analysis = SA(
-                                path=file_path,
-                                language='JSON (config)',
-                                group='code',
-                                code=analysis.code_count,
-                                documentation=analysis.documentation_count,
-                                empty=analysis.empty_count,
-                                string=analysis.string_count,
-                                state=SourceState.analyzed
-                            )
-                            summary.add(config_analysis)
-                    except Exception as e:
-                        logger.debug(f"Error processing JSON config {file_path}: {e}")
-                    continue
-                
-                # Check if this is an AL file (Business Central)
-                if file_path.lower().endswith('.al'):
-                    try:
-                        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                            lines = f.readlines()
-                            code_lines = 0
-                            comment_lines = 0
-                            empty_lines = 0
-                            in_block_comment = False
-                            
-                            for line in lines:
-                                stripped = line.strip()
-                                if not stripped:
-                                    empty_lines += 1
-                                elif in_block_comment:
-                                    comment_lines += 1
-                                    if '*/' in stripped:
-                                        in_block_comment = False
-                                elif stripped.startswith('//'):
-                                    comment_lines += 1
-                                elif stripped.startswith('/*'):
-                                    comment_lines += 1
-                                    if '*/' not in stripped:
-                                        in_block_comment = True
-                                else:
-                                    code_lines += 1
-                            
-                            # Create a manual analysis entry for AL
-                            from pygount.analysis import SourceAnalysis as SA, SourceState
-                            manual_analysis = SA(
-                                path=file_path,
-                                language='AL',
-                                group='code',
-                                code=code_lines,
-                                documentation=comment_lines,
-                                empty=empty_lines,
-                                string=0,
-                                state=SourceState.analyzed
-                            )
-                            summary.add(manual_analysis)
-                    except Exception as e:
-                        logger.debug(f"Error processing AL file {file_path}: {e}")
-                    continue
-                
-                try:
-                    # pygount will try to infer the language
-                    analysis = SourceAnalysis.from_file(file_path, "pygount", fallback_encoding="utf-8")
+        # tokei and scc walk and count the whole tree natively, only AL and JSON files are left for the walk below
+        native_languages = run_native_analyzer(directory) if ANALYZER_PATH else None
+        
+        file_paths = []
+        for entry in scan_files(directory):
+            name = entry.name.lower()
+            extension = os.path.splitext(name)[1]
+            # Skip binary and minified files by name without opening them
+            if extension in BINARY_EXTENSIONS or name.endswith(MINIFIED_SUFFIXES):
+                continue
+            if native_languages is None or extension in ('.al', '.json'):
+                file_paths.append(entry.path)
+        
+        # Counting is CPU bound, worker processes sidestep the GIL
+        if analysis_pool is not None and not analysis_pool_broken.is_set():
+            try:
+                file_results = list(analysis_pool.map(analyze_file, file_paths, chunksize=32))
+            except BrokenProcessPool:
+                # A worker was killed (out of memory, crash in a lexer); the pool cannot be used anymore
+                analysis_pool_broken.set()
+                logger.error("An analysis worker process died, the remaining repositories are counted in-process")
+                raise
+        else:
+            file_results = map(analyze_file, file_paths)
+        
+        for file_path, file_result in zip(file_paths, file_results):
+            if file_result is None:
+                continue
+            language, code, documentation, empty, string = file_result
+            summary.add(SourceAnalysis(
+                path=file_path,
+                language=language,
+                group='code',
+                code=code,
+                documentation=documentation,
+                empty=empty,
+                string=string,
+                state=SourceState.analyzed
+            ))
+        
+        for language, code, documentation, empty in native_languages or []:
+            summary.add(SourceAnalysis(
+                path=directory,
+                language=language,
+                group='code',
+                code=code,
+                documentation=documentation,
+                empty=empty,
+                string=0,
+                state=SourceState.analyzed
+            ))
                     
-                    # Skip pseudo-languages
-                    if analysis.language not in ['__binary__', '__error__', '__unknown__', '__empty__', '__generated__']:
-                        summary.add(analysis)
-                except Exception as e:
-                    # Suppress warnings for unknown languages
-                    if "unknown language" not in str(e).lower():
-                        logger.debug(f"Skipping {file_path}: {e}")
-                
         # Filter out pseudo-languages from the language list
-        filtered_languages = {
-            lang: data for lang, data in summary.language_to_language_summary_map.items()
-            if lang not in ['__binary__', '__error__', '__unknown__', '__empty__', '__generated__']
-        }
+        language_map = summary.language_to_language_summary_map
+        languages = sorted(lang for lang in language_map if lang not in PSEUDO_LANGUAGES)
         
         # Build language breakdown for CSV export
         language_breakdown = []
-        for lang, lang_summary in sorted(filtered_languages.items()):
+        for lang in languages:
+            lang_summary = language_map[lang]
             language_breakdown.append({
                 "language": lang,
                 "code": lang_summary.code_count,
@@ -466,185 +777,399 @@ def analyze_directory(directory):
             "code": summary.total_code_count,
             "documentation": summary.total_documentation_count, # comments/docstrings
             "empty": summary.total_empty_count,
-            "languages": ", ".join(sorted(filtered_languages.keys())) if filtered_languages else "",
+            "languages": ", ".join(languages),
             "language_breakdown": language_breakdown
         }
     except Exception as e:
-        logger.error(f"Error analyzing {directory}: {e}", exc_info=True)
-        return {"code": 0, "documentation": 0, "empty": 0, "languages": "", "language_breakdown": []}
+        # Raised so the repository is reported as ERROR and its zero counts are never cached
+        raise Exception(f"Analysis failed: {e}") from e
+
+def run_git(step, command):
+    """Run a git command, raising an exception with git's error output on failure."""
+    # Use subprocess for better control over git authentication
+    # Only stderr is kept, and it stays undecoded unless the command fails
+    result = subprocess.run(
+        command,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        env=GIT_ENV,
+        check=False
+    )
+    
+    if result.returncode != 0:
+        raise Exception(f"Git {step} failed: {result.stderr[-4096:].decode('utf-8', 'replace')}")
+
+def clone_repository(remote_url, target_dir):
+    """Clone the tip of the default branch, skipping blobs that are never analyzed."""
+    # Create target directory
+    os.makedirs(target_dir, exist_ok=True)
+    
+    # Shallow, blob-less clone without checkout: only commits and trees are transferred here.
+    # If the server does not support filters git falls back to a regular shallow clone.
+    run_git('clone', ['git', 'clone', '--depth=1', '--filter=blob:none', '--single-branch', '--no-tags', '--no-checkout',
+                      remote_url, target_dir])
+    
+    # Empty repositories have nothing to check out
+    head = subprocess.run(['git', '-C', target_dir, 'rev-parse', '--verify', '-q', 'HEAD'],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if head.returncode != 0:
+        logger.debug(f"Empty repository: {remote_url}")
+        return
+    
+    # Restrict the working tree to files worth analyzing, then check out;
+    # git fetches the remaining blobs in a single batch
+    run_git('sparse-checkout', ['git', '-C', target_dir, 'sparse-checkout', 'set', '--no-cone', '/*'] +
+                               [f'!*{ext}' for ext in SPARSE_CHECKOUT_EXCLUDE])
+    run_git('checkout', ['git', '-C', target_dir, 'checkout'])
+    
+    # Only the working tree is analyzed, drop the object store right away to free the space
+    shutil.rmtree(os.path.join(target_dir, '.git'), ignore_errors=True)
+
+def ensure_mirror(project_name, repo):
+    """Create or update the cached bare mirror of a repository. Returns its path, or None if the repository is empty."""
+    if not repo.default_branch:
+        return None
+    
+    mirror_dir = os.path.join(CLONE_CACHE_DIR, project_name, f"{repo.name}.git")
+    if not os.path.isdir(mirror_dir):
+        os.makedirs(mirror_dir)
+        run_git('init', ['git', 'init', '--bare', '-q', mirror_dir])
+        run_git('remote add', ['git', '-C', mirror_dir, 'remote', 'add', 'origin', repo.remote_url])
+    
+    # Only the new tip is transferred; blobs already in the mirror are never downloaded again
+    branch_ref = repo.default_branch
+    run_git('fetch', ['git', '-C', mirror_dir, 'fetch', '--depth=1', '--filter=blob:none', '--no-tags',
+                      'origin', f'+{branch_ref}:{branch_ref}'])
+    return mirror_dir
+
+def checkout_from_mirror(project_name, repo, target_dir):
+    """Extract a snapshot of the default branch of a repository from its cached mirror into target_dir."""
+    mirror_dir = ensure_mirror(project_name, repo)
+    os.makedirs(target_dir, exist_ok=True)
+    if mirror_dir is None:
+        logger.debug(f"Empty repository: {repo.remote_url}")
+        return
+    
+    # Only the files are needed, so the tree is streamed straight into tar: no index,
+    # no worktree metadata and no .git in target_dir. Blobs missing from the mirror
+    # are fetched in a single batch and kept for the next run.
+    archive = subprocess.Popen(['git', '--git-dir', mirror_dir, 'archive', '--format=tar', repo.default_branch],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=GIT_ENV)
+    extract = subprocess.run(['tar', '-x', '-f', '-', '-C', target_dir], stdin=archive.stdout,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=False)
+    archive.stdout.close()
+    archive_stderr = archive.stderr.read()
+    archive.stderr.close()
+    
+    if archive.wait() != 0:
+        raise Exception(f"Git archive failed: {archive_stderr[-4096:].decode('utf-8', 'replace')}")
+    if extract.returncode != 0:
+        raise Exception(f"Extracting archive failed: {extract.stderr[-4096:].decode('utf-8', 'replace')}")
+
+def get_default_branch_commit(git_client, project_name, repo):
+    """Return the commit id at the tip of the repository's default branch, or None if it has none."""
+    if not repo.default_branch:
+        return None
+    branch_name = repo.default_branch.replace('refs/heads/', '', 1)
+    branch = git_client.get_branch(repo.id, branch_name, project_name)
+    return branch.commit.commit_id
+
+def analysis_settings():
+    """Settings that change the cached results; a cache written with other settings is not reused."""
+    return {
+        "version": CACHE_VERSION,
+        "analyzer": ANALYZER if ANALYZER_PATH else 'pygount',
+        "max_file_size_mb": MAX_FILE_SIZE_MB,
+        "skipped": sorted(BINARY_EXTENSIONS) + list(MINIFIED_SUFFIXES),
+        "llm": [LLM_PROVIDER, LLM_MODEL, LLM_PROMPT],
+    }
+
+def load_analysis_cache():
+    """Load the per-repository results of previous runs, keyed by repository id."""
+    if not ANALYSIS_CACHE_ENABLED or not os.path.exists(ANALYSIS_CACHE_FILE):
+        return {}
+    try:
+        with open(ANALYSIS_CACHE_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable analysis cache {ANALYSIS_CACHE_FILE}: {e}")
+        return {}
+    if not isinstance(data, dict) or data.get("settings") != analysis_settings():
+        logger.info(f"Analysis settings changed since {ANALYSIS_CACHE_FILE} was written, rescanning all repositories")
+        return {}
+    return data.get("repositories", {})
+
+def save_analysis_cache(cache):
+    """Write the analysis cache atomically so an interrupted run never leaves a truncated file."""
+    if not ANALYSIS_CACHE_ENABLED:
+        return
+    temp_file = ANALYSIS_CACHE_FILE + '.tmp'
+    with open(temp_file, "w", encoding="utf-8") as f:
+        json.dump({"settings": analysis_settings(), "repositories": cache}, f)
+    os.replace(temp_file, ANALYSIS_CACHE_FILE)
+
+def get_clone_root():
+    """Return the directory to create the clone area in: the RAM-backed SCAN_TMPFS if it has room, else None (system default)."""
+    if not SCAN_TMPFS:
+        return None
+    try:
+        free_mb = shutil.disk_usage(SCAN_TMPFS).free // (1024 * 1024)
+    except OSError as e:
+        logger.warning(f"Cannot use {SCAN_TMPFS} for clones: {e}")
+        return None
+    
+    if free_mb < SCAN_TMPFS_MIN_FREE_MB:
+        logger.info(f"Only {free_mb} MB free on {SCAN_TMPFS}, cloning to disk instead")
+        return None
+    logger.info(f"Cloning into RAM-backed {SCAN_TMPFS} ({free_mb} MB free)")
+    return SCAN_TMPFS
+
+def remove_checkout(target_dir, checkout_slots):
+    """Delete a cloned repository and give its checkout slot back."""
+    try:
+        if os.path.exists(target_dir):
+            shutil.rmtree(target_dir)
+            logger.debug(f"Cleaned up {target_dir}")
+    except Exception as cleanup_error:
+        logger.warning(f"Failed to cleanup {target_dir}: {cleanup_error}")
+    finally:
+        checkout_slots.release()
+
+def process_repo(project_name, repo, temp_dir, lock, report, csv_writer, git_client, cache, commits,
+                 analysis_pool, cleanup_pool, checkout_slots):
+    """Clone, analyze and report a single repository. Returns its result row."""
+    repo_name = repo.name
+    remote_url = repo.remote_url
+    
+    target_dir = os.path.join(temp_dir, project_name, repo_name)
+    has_checkout = False
+    
+    logger.info(f"Processing: {project_name} / {repo_name}")
+    
+    try:
+        # Resolve the default branch tip with a single REST call, before any clone
+        commit_id = None
+        if ANALYSIS_CACHE_ENABLED:
+            try:
+                commit_id = get_default_branch_commit(git_client, project_name, repo)
+            except Exception as e:
+                logger.debug(f"Could not resolve default branch of {repo_name}: {e}")
+        
+        cached = cache.get(repo.id) if commit_id else None
+        # Forks and copies at the same commit have the same content; LLM descriptions are per repository
+        same_commit = commits.get(commit_id) if commit_id and not LLM_ENABLED else None
+        if not repo.default_branch:
+            logger.info("  Empty repository, nothing to analyze")
+            stats = empty_stats()
+            llm_success = False
+        elif cached and cached['commit'] == commit_id and (cached['llm'] or not LLM_ENABLED):
+            logger.info(f"  Unchanged since last scan ({commit_id[:8]}), reusing cached results")
+            stats = cached['stats']
+            llm_success = cached['llm']
+        elif same_commit:
+            logger.info(f"  Same commit as an already analyzed repository ({commit_id[:8]}), reusing its results")
+            stats = same_commit['stats']
+            llm_success = False
+            with lock:
+                cache[repo.id] = {"commit": commit_id, "stats": stats, "llm": llm_success}
+        else:
+            # Limits the checkouts on disk while their deletion is still pending
+            checkout_slots.acquire()
+            has_checkout = True
+            if CLONE_CACHE_ENABLED:
+                checkout_from_mirror(project_name, repo, target_dir)
+            else:
+                clone_repository(remote_url, target_dir)
+            
+            # Analyze
+            stats = analyze_directory(target_dir, analysis_pool)
+            
+            # LLM Analysis (if enabled)
+            llm_success = False
+            if LLM_ENABLED:
+                llm_success = analyze_repository_with_llm(target_dir, repo_name, project_name)
+            
+            if commit_id:
+                with lock:
+                    cache[repo.id] = commits[commit_id] = {"commit": commit_id, "stats": stats, "llm": llm_success}
+        
+        result_row = [
+            project_name,
+            repo_name,
+            stats['code'],
+            stats['documentation'],
+            stats['empty'],
+            stats['languages']
+        ]
+        
+        # Language breakdown for the CSV
+        csv_rows = []
+        if stats['language_breakdown']:
+            for i, lang_data in enumerate(stats['language_breakdown']):
+                row = [
+                    project_name,
+                    repo_name,
+                    lang_data['language'],
+                    lang_data['code'],
+                    lang_data['documentation'],
+                    lang_data['empty']
+                ]
+                # Add LLM status only to first row per repository
+                if LLM_ENABLED and i == 0:
+                    row.append('Yes' if llm_success else 'No')
+                elif LLM_ENABLED:
+                    row.append('')
+                csv_rows.append(row)
+        else:
+            # If no languages detected, write a single row with empty language
+            row = [project_name, repo_name, "", 0, 0, 0]
+            if LLM_ENABLED:
+                row.append('Yes' if llm_success else 'No')
+            csv_rows.append(row)
+        
+        # Reports are shared between workers, write them one repository at a time
+        with lock:
+            csv_writer.writerows(csv_rows)
+            report.write(f"| {project_name} | {repo_name} | {stats['code']:,} | {stats['documentation']:,} | {stats['empty']:,} | {stats['languages']} |\n")
+        
+        # Clean up the cloned repository in the background, so the worker can start on the next one
+        if has_checkout:
+            cleanup_pool.submit(remove_checkout, target_dir, checkout_slots)
+        
+        return result_row
+        
+    except Exception as e:
+        logger.error(f"Failed to clone or process {repo_name}: {e}", exc_info=True)
+        result_row = [project_name, repo_name, "ERROR", 0, 0, 0]
+        
+        with lock:
+            # Write error to CSV
+            csv_writer.writerow([project_name, repo_name, "ERROR", 0, 0, 0])
+            
+            # Write error result to the report
+            report.write(f"| {project_name} | {repo_name} | ERROR | 0 | 0 | - |\n")
+        
+        # Try to clean up even on error
+        if has_checkout:
+            cleanup_pool.submit(remove_checkout, target_dir, checkout_slots)
+        
+        return result_row
 
 def main():
+    setup_logging()
+    if ANALYZER in ('tokei', 'scc') and ANALYZER_PATH is None:
+        logger.warning(f"{ANALYZER} was not found on PATH, counting lines with pygount")
     try:
         # Connect to ADO
         credentials = BasicAuthentication('', PERSONAL_ACCESS_TOKEN)
         connection = Connection(base_url=ORGANIZATION_URL, creds=credentials)
         
-        repos = get_all_repositories(connection)
+        git_client = connection.clients.get_git_client()
+        repos = get_all_repositories(connection, git_client)
         logger.info(f"Total repositories found: {len(repos)}")
+        
+        # Disabled repositories cannot be cloned
+        disabled = [f"{project_name}/{repo.name}" for project_name, repo in repos if repo.is_disabled]
+        if disabled:
+            logger.info(f"Skipping {len(disabled)} disabled repositories: {', '.join(disabled)}")
+            repos = [(project_name, repo) for project_name, repo in repos if not repo.is_disabled]
+        
+        cache = load_analysis_cache()
+        # Results by commit, shared by repositories at the same commit
+        commits = {entry['commit']: entry for entry in cache.values()}
 
         results = []
-        csv_rows = []
         
         # Initialize the CSV file with headers
-        import csv
         csv_headers = ["Project", "Repository", "Language", "LOC (Code)", "Comments", "Empty Lines"]
         if LLM_ENABLED:
             csv_headers.append("AI_Description_Generated")
         
-        with open(CSV_OUTPUT_FILE, "w", encoding="utf-8", newline='') as csvfile:
-            csv_writer = csv.writer(csvfile, delimiter=';')
-            csv_writer.writerow(csv_headers)
+        # Both reports stay open for the whole run, workers append their rows through these handles
+        csv_file = open(CSV_OUTPUT_FILE, "w", encoding="utf-8", newline='', buffering=1 << 16)
+        csv_writer = csv.writer(csv_file, delimiter=';')
+        csv_writer.writerow(csv_headers)
+        csv_file.flush()
         
         logger.info(f"CSV output will be written to: {CSV_OUTPUT_FILE}")
         
-        # Initialize the report file with headers
-        headers = ["Project", "Repository", "LOC (Code)", "Comments", "Empty Lines", "Languages"]
-        with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-            f.write(f"""
+        # No newline translation, so the reserved status block is the same number of bytes on every platform
+        report = open(OUTPUT_FILE, "w+", encoding="utf-8", newline='\n', buffering=1 << 16)
+        analysis_pool = None
+        log_listener = None
+        try:
+            # Initialize the report file with headers
+            headers = ["Project", "Repository", "LOC (Code)", "Comments", "Empty Lines", "Languages"]
+            report.write(f"""
 # Azure DevOps Code Analysis Report
 
 **Organization:** {ORGANIZATION_URL}
 **Total Repositories:** {len(repos)}
-**Status:** In Progress...
-
+""")
+            # Reserve a fixed-width status block, it is overwritten in place once the scan is done
+            status_offset = report.tell()
+            report.write("**Status:** In Progress...".ljust(REPORT_STATUS_WIDTH) + "\n")
+            report.write("""
 ## Detailed Breakdown
 
 """)
             # Write table headers
-            f.write("| " + " | ".join(headers) + " |\n")
-            f.write("|" + "|".join(["-" * (len(h) + 2) for h in headers]) + "|\n")
-            f.flush()
-
-        # Create a temporary directory for cloning
-        with tempfile.TemporaryDirectory() as temp_dir:
-            for project_name, repo in repos:
-                repo_name = repo.name
-                remote_url = repo.remote_url
-                
-                target_dir = os.path.join(temp_dir, project_name, repo_name)
-                
-                logger.info(f"Processing: {project_name} / {repo_name}")
-                
-                try:
-                    # Shallow clone (depth=1) is much faster and uses less storage
-                    # Use subprocess for better control over git authentication
-                    import subprocess
-                    
-                    # Azure DevOps authentication: Base64 encode ':PAT'
-                    auth_bytes = f':{PERSONAL_ACCESS_TOKEN}'.encode('utf-8')
-                    base64_auth = base64.b64encode(auth_bytes).decode('utf-8')
-                    
-                    # Create target directory
-                    os.makedirs(target_dir, exist_ok=True)
-                    
-                    # Run git clone with authentication header
-                    result = subprocess.run(
-                        ['git', 'clone', '--depth=1', '-v',
-                         '-c', f'http.extraHeader=Authorization: Basic {base64_auth}',
-                         remote_url, target_dir],
-                        capture_output=True,
-                        text=True
-                    )
-                    
-                    if result.returncode != 0:
-                        raise Exception(f"Git clone failed: {result.stderr}")
-                    
-                    # Analyze
-                    stats = analyze_directory(target_dir)
-                    
-                    # LLM Analysis (if enabled)
-                    llm_success = False
-                    if LLM_ENABLED:
-                        llm_success = analyze_repository_with_llm(target_dir, repo_name, project_name)
-                    
-                    result_row = [
-                        project_name,
-                        repo_name,
-                        stats['code'],
-                        stats['documentation'],
-                        stats['empty'],
-                        stats['languages']
-                    ]
-                    results.append(result_row)
-                    
-                    # Write language breakdown to CSV
-                    with open(CSV_OUTPUT_FILE, "a", encoding="utf-8", newline='') as csvfile:
-                        csv_writer = csv.writer(csvfile, delimiter=';')
-                        if stats['language_breakdown']:
-                            for i, lang_data in enumerate(stats['language_breakdown']):
-                                row = [
-                                    project_name,
-                                    repo_name,
-                                    lang_data['language'],
-                                    lang_data['code'],
-                                    lang_data['documentation'],
-                                    lang_data['empty']
-                                ]
-                                # Add LLM status only to first row per repository
-                                if LLM_ENABLED and i == 0:
-                                    row.append('Yes' if llm_success else 'No')
-                                elif LLM_ENABLED:
-                                    row.append('')
-                                csv_writer.writerow(row)
-                        else:
-                            # If no languages detected, write a single row with empty language
-                            row = [project_name, repo_name, "", 0, 0, 0]
-                            if LLM_ENABLED:
-                                row.append('Yes' if llm_success else 'No')
-                            csv_writer.writerow(row)
-                    
-                    # Immediately write this result to the report
-                    with open(OUTPUT_FILE, "a", encoding="utf-8") as f:
-                        f.write(f"| {project_name} | {repo_name} | {stats['code']:,} | {stats['documentation']:,} | {stats['empty']:,} | {stats['languages']} |\n")
-                        f.flush()
-                    
-                    # Clean up the cloned repository to save disk space
-                    try:
-                        shutil.rmtree(target_dir)
-                        logger.debug(f"Cleaned up {target_dir}")
-                    except Exception as cleanup_error:
-                        logger.warning(f"Failed to cleanup {target_dir}: {cleanup_error}")
-                    
-                except Exception as e:
-                    logger.error(f"Failed to clone or process {repo_name}: {e}", exc_info=True)
-                    result_row = [project_name, repo_name, "ERROR", 0, 0, 0]
-                    results.append(result_row)
-                    
-                    # Write error to CSV
-                    with open(CSV_OUTPUT_FILE, "a", encoding="utf-8", newline='') as csvfile:
-                        csv_writer = csv.writer(csvfile, delimiter=';')
-                        csv_writer.writerow([project_name, repo_name, "ERROR", 0, 0, 0])
-                    
-                    # Write error result to the report
-                    with open(OUTPUT_FILE, "a", encoding="utf-8") as f:
-                        f.write(f"| {project_name} | {repo_name} | ERROR | 0 | 0 | - |\n")
-                        f.flush()
-                    
-                    # Try to clean up even on error
-                    try:
-                        if os.path.exists(target_dir):
-                            shutil.rmtree(target_dir)
-                    except Exception:
-                        pass
-
-        # --- Update Report with Final Summary ---
-        # Calculate Totals
-        total_code = sum(r[2] for r in results if isinstance(r[2], int))
-        total_comments = sum(r[3] for r in results if isinstance(r[3], int))
-        
-        # Read the existing report
-        with open(OUTPUT_FILE, "r", encoding="utf-8") as f:
-            report_content = f.read()
-        
-        # Update the status and totals
-        report_content = report_content.replace(
-            "**Status:** In Progress...",
-            f"**Status:** Complete\n**Total Lines of Code:** {total_code:,}\n**Total Lines of Comments:** {total_comments:,}"
-        )
+            report.write("| " + " | ".join(headers) + " |\n")
+            report.write("|" + "|".join(["-" * (len(h) + 2) for h in headers]) + "|\n")
+            report.flush()
+            
+            # Line counting of all repositories shares one pool of worker processes. They are
+            # spawned rather than forked because the clone threads are already running.
+            if ANALYZE_JOBS > 1:
+                mp_context = multiprocessing.get_context('spawn')
+                # Workers have no handlers of their own, their records are written by this process
+                log_queue = mp_context.Queue()
+                log_listener = logging.handlers.QueueListener(log_queue, *logger.handlers, respect_handler_level=True)
+                log_listener.start()
+                analysis_pool = ProcessPoolExecutor(max_workers=ANALYZE_JOBS, mp_context=mp_context,
+                                                    initializer=setup_worker_logging, initargs=(log_queue,))
+            
+            # Clone and analyze repositories in parallel, streaming rows into the report as they finish
+            lock = threading.Lock()
+            checkout_slots = threading.Semaphore(2 * CLONE_JOBS)
+            # Leaving the with block waits for pending deletions before the temporary directory goes
+            with tempfile.TemporaryDirectory(dir=get_clone_root()) as temp_dir, \
+                    ThreadPoolExecutor(max_workers=CLONE_JOBS) as executor, \
+                    ThreadPoolExecutor(max_workers=2) as cleanup_pool:
+                futures = [
+                    executor.submit(process_repo, project_name, repo, temp_dir, lock, report, csv_writer,
+                                    git_client, cache, commits, analysis_pool, cleanup_pool, checkout_slots)
+                    for project_name, repo in repos
+                ]
+                for future in as_completed(futures):
+                    results.append(future.result())
+                    # Rows are buffered, push them to disk every few repositories
+                    if len(results) % REPORT_FLUSH_EVERY == 0:
+                        with lock:
+                            csv_file.flush()
+                            report.flush()
+            
+            # --- Update Report with Final Summary ---
+            # Calculate Totals
+            total_code = sum(r[2] for r in results if isinstance(r[2], int))
+            total_comments = sum(r[3] for r in results if isinstance(r[3], int))
+            
+            # Update the status and totals without reading back and rewriting the whole report
+            report.seek(status_offset)
+            report.write(
+                f"**Status:** Complete\n**Total Lines of Code:** {total_code:,}\n**Total Lines of Comments:** {total_comments:,}"
+                .ljust(REPORT_STATUS_WIDTH)
+            )
+        finally:
+            if analysis_pool is not None:
+                analysis_pool.shutdown()
+            if log_listener is not None:
+                log_listener.stop()
+            report.close()
+            csv_file.close()
         
-        # Write the final report
-        with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-            f.write(report_content)
+        # Keep only repositories that still exist
+        save_analysis_cache({repo.id: cache[repo.id] for _, repo in repos if repo.id in cache})
         
         logger.info(f"Analysis complete. Report saved to {OUTPUT_FILE}")
         logger.info(f"CSV report saved to {CSV_OUTPUT_FILE}")